@@ -1,10 +1,15 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
-import pyomo.environ as pyo
+import plotly.express as px
 import os
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 # Set up the Streamlit page
 st.set_page_config(page_title="ICU Allocation Dashboard", layout="wide")
 st.title("🏥 Hospital ICU Bed Allocation Optimizer")
@@ -13,76 +18,171 @@ This dashboard visualizes the **optimized ICU bed allocation** based on actual C
 and hospital capacity. You can also simulate your own demand scenarios below.
 """)
 
+# Elementwise max(demand - allocated, 0), NaN-preserving like Series.clip;
+# JIT-compiled when numba is installed. Kept serial: Streamlit calls this from
+# a worker thread, where numba's parallel workqueue layer is unsafe.
+if njit is not None:
+    @njit(cache=True)
+    def _shortage(d, a, out):
+        for i in range(d.shape[0]):
+            v = d[i] - a[i]
+            out[i] = 0.0 if v < 0 else v
+else:
+    def _shortage(d, a, out):
+        np.subtract(d, a, out=out)
+        np.maximum(out, 0.0, out=out)
+
 # Load dataset
 data_path = "hospital_optimized_allocation.csv"
-@st.cache_data
-def load_data(path):
-    df = pd.read_csv(path)
-    df["shortage"] = df["staffed_icu_adult_patients_confirmed_covid_7_day_avg"] - df["icu_allocated"]
-    df["shortage"] = df["shortage"].clip(lower=0)
+DEMAND_COL = "staffed_icu_adult_patients_confirmed_covid_7_day_avg"
+# Parse the raw CSV and derive the shortage column
+def build_dataset(path):
+    df = pd.read_csv(path, engine="pyarrow", dtype={
+        DEMAND_COL: "float32",
+        "icu_allocated": "float32",
+        "state": "category",
+        "urban_status": "category",
+    })
+    demand = df[DEMAND_COL].to_numpy()
+    alloc = df["icu_allocated"].to_numpy()
+    shortage = np.empty_like(demand)
+    _shortage(demand, alloc, shortage)
+    df["shortage"] = shortage
     return df
 
-df = load_data(data_path)
+# Bump whenever build_dataset's output changes so stale Parquet copies are rebuilt
+DATASET_VERSION = 1
+
+@st.cache_data
+def load_data(path):
+    # Reuse the enriched Parquet copy unless the CSV or build_dataset has changed since it was written
+    parquet_path = f"{os.path.splitext(path)[0]}.v{DATASET_VERSION}.parquet"
+    df = None
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(path):
+        try:
+            df = pd.read_parquet(parquet_path, engine="pyarrow")
+        except Exception:
+            df = None  # truncated or unreadable copy; rebuild below
+    if df is None:
+        df = build_dataset(path)
+        tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(tmp_path, engine="pyarrow", compression="zstd", index=False)
+            os.replace(tmp_path, parquet_path)
+        except OSError:
+            # read-only deployments just rebuild from the CSV
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # Per-(state, urban status) totals so reruns only re-sum this small frame
+    agg = None
+    if "urban_status" in df.columns:
+        agg = df.groupby(["state", "urban_status"], observed=True)[
+            [DEMAND_COL, "icu_allocated"]
+        ].sum()
+
+    # Sidebar options; categories are already the sorted distinct values
+    state_options = tuple(df["state"].cat.categories.tolist())
+    urban_options = tuple(df["urban_status"].cat.categories.tolist()) if "urban_status" in df.columns else None
+    return df, agg, state_options, urban_options
+
+_, _, states, urban_types = load_data(data_path)
 
 # Sidebar filters
 st.sidebar.header("Filter Hospitals")
-states = df["state"].dropna().unique()
 selected_states = st.sidebar.multiselect("Select State(s):", options=states, default=states)
 
-if "urban_status" in df.columns:
-    urban_types = df["urban_status"].unique()
+selected_urban = None
+if urban_types is not None:
     selected_urban = st.sidebar.multiselect("Select Urban Status:", options=urban_types, default=urban_types)
-    df = df[df["urban_status"].isin(selected_urban)]
 
-# Apply state filter
-df = df[df["state"].isin(selected_states)]
+# Match selections against category codes instead of object values
+def category_mask(column, selected):
+    code_map = dict(zip(column.cat.categories, range(len(column.cat.categories))))
+    selected_codes = np.array([code_map[v] for v in selected if v in code_map], dtype=np.int16)
+    return np.isin(column.cat.codes.values, selected_codes)
+
+# Rows shown in the data table unless the user asks for the full sort
+TABLE_TOP_K = 500
+
+# Filter, aggregate and encode once per unique selection
+@st.cache_data(max_entries=32)
+def filtered_view(states_tuple, urban_tuple):
+    df, agg, _, _ = load_data(data_path)
+    mask = category_mask(df["state"], states_tuple)
+    if urban_tuple is not None:
+        mask &= category_mask(df["urban_status"], urban_tuple)
+    df = df.loc[mask]
+
+    grouped = None
+    if agg is not None:
+        agg_mask = agg.index.get_level_values("state").isin(states_tuple)
+        if urban_tuple is not None:
+            agg_mask &= agg.index.get_level_values("urban_status").isin(urban_tuple)
+        grouped = agg[agg_mask].groupby(level="urban_status", observed=True).sum()
+        grouped["shortage"] = grouped[DEMAND_COL] - grouped["icu_allocated"]
+
+    csv_bytes = df.to_csv(index=False).encode('utf-8')
+    top_df = df.nlargest(TABLE_TOP_K, "shortage").reset_index(drop=True)
+    return df, grouped, csv_bytes, top_df
+
+df, grouped, csv_bytes, top_df = filtered_view(
+    tuple(selected_states),
+    tuple(selected_urban) if selected_urban is not None else None,
+)
+
+# Fetch the summed columns once per rerun for the metrics and the diagonal
+demand_arr = df[DEMAND_COL].to_numpy()
+alloc_arr = df["icu_allocated"].to_numpy()
 
 # Summary section
 st.subheader("📊 Summary Statistics")
 col1, col2, col3 = st.columns(3)
-col1.metric("Total ICU Demand", f"{df['staffed_icu_adult_patients_confirmed_covid_7_day_avg'].sum():,.0f}")
-col2.metric("Total ICU Allocated", f"{df['icu_allocated'].sum():,.0f}")
-col3.metric("Total Shortage", f"{df['shortage'].sum():,.0f}")
+col1.metric("Total ICU Demand", f"{np.nansum(demand_arr):,.0f}")
+col2.metric("Total ICU Allocated", f"{np.nansum(alloc_arr):,.0f}")
+col3.metric("Total Shortage", f"{np.nansum(df['shortage'].to_numpy()):,.0f}")
 
 # Optional: Grouped summary
-if "urban_status" in df.columns:
+if grouped is not None:
     st.markdown("### ICU Demand vs Allocation by Urban Status")
-    grouped = df.groupby("urban_status")[
-        ["staffed_icu_adult_patients_confirmed_covid_7_day_avg", "icu_allocated"]
-    ].sum()
-    grouped["shortage"] = grouped["staffed_icu_adult_patients_confirmed_covid_7_day_avg"] - grouped["icu_allocated"]
     st.dataframe(grouped.round(1))
 
 # Plotting section
 st.markdown("### ICU Allocation vs. COVID Demand")
-fig, ax = plt.subplots(figsize=(7, 5))
-sns.scatterplot(
-    data=df,
-    x="staffed_icu_adult_patients_confirmed_covid_7_day_avg",
+# Cap the number of drawn points; beyond a few thousand they are indistinguishable
+MAX_PLOT_POINTS = 5000
+plot_df = df if len(df) <= MAX_PLOT_POINTS else df.sample(MAX_PLOT_POINTS, random_state=0)
+xmax = float(np.nanmax(demand_arr)) if demand_arr.size else 0.0
+fig = px.scatter(
+    plot_df,
+    x=DEMAND_COL,
     y="icu_allocated",
-    hue="urban_status" if "urban_status" in df.columns else None,
-    ax=ax
+    color="urban_status" if "urban_status" in df.columns else None,
+    render_mode="webgl",
+    labels={
+        DEMAND_COL: "Confirmed ICU COVID Patients",
+        "icu_allocated": "ICU Beds Allocated",
+    },
+    title="Allocation Effectiveness",
 )
-ax.plot(
-    [0, df["staffed_icu_adult_patients_confirmed_covid_7_day_avg"].max()],
-    [0, df["staffed_icu_adult_patients_confirmed_covid_7_day_avg"].max()],
-    'r--', label="Perfect Allocation"
+fig.add_scatter(
+    x=[0, xmax], y=[0, xmax], mode="lines",
+    line=dict(dash="dash", color="red"), name="Perfect Allocation"
 )
-ax.set_xlabel("Confirmed ICU COVID Patients")
-ax.set_ylabel("ICU Beds Allocated")
-ax.set_title("Allocation Effectiveness")
-ax.legend()
-ax.grid(True)
-st.pyplot(fig)
+st.plotly_chart(fig, width="stretch")
 
 # Show data table
 st.markdown("### Raw Data Table (Filtered)")
-st.dataframe(df.sort_values("shortage", ascending=False).reset_index(drop=True))
+if st.checkbox("Show all rows", value=False):
+    st.dataframe(df.sort_values("shortage", ascending=False).reset_index(drop=True))
+else:
+    st.caption(f"Top {len(top_df):,} of {len(df):,} hospitals by shortage")
+    st.dataframe(top_df)
 
 # Download link
 st.download_button(
     label="💾 Download Optimized CSV",
-    data=df.to_csv(index=False).encode('utf-8'),
+    data=csv_bytes,
     file_name='hospital_optimized_allocation_filtered.csv',
     mime='text/csv'
 )
@@ -123,40 +223,31 @@ if simulate_button:
             "critical": total_patients * (perc_critical / 100),
         }
 
-        # Prepare optimization model
-        sim_model = pyo.ConcreteModel()
-        sim_model.GROUPS = pyo.Set(initialize=["moderate", "severe", "critical"])
-        sim_model.x = pyo.Var(sim_model.GROUPS, domain=pyo.NonNegativeReals)
-
-        sim_model.obj = pyo.Objective(
-            expr=sum(weights[g] * (demand_dist[g] - sim_model.x[g]) for g in sim_model.GROUPS),
-            sense=pyo.minimize
-        )
-
-        sim_model.capacity_limit = pyo.Constraint(expr=sum(sim_model.x[g] for g in sim_model.GROUPS) <= total_patients)
-
-        solver = pyo.SolverFactory("glpk")
-        if not solver.available():
-            st.error("❌ GLPK solver not available in current environment.")
-        else:
-            results = solver.solve(sim_model, tee=False)
-
-            st.success("✅ Optimization complete.")
-            sim_results = {g: pyo.value(sim_model.x[g]) for g in sim_model.GROUPS}
-            result_df = pd.DataFrame({
-                "Group": list(sim_results.keys()),
-                "Allocated": list(sim_results.values()),
-                "Demand": [demand_dist[g] for g in sim_model.GROUPS],
-                "Unmet": [demand_dist[g] - sim_results[g] for g in sim_model.GROUPS]
-            })
-
-            st.dataframe(result_df.round(1))
-
-            fig2, ax2 = plt.subplots(figsize=(6, 4))
-            ax2.bar(result_df["Group"], result_df["Demand"], label="Demand", alpha=0.6)
-            ax2.bar(result_df["Group"], result_df["Allocated"], label="Allocated", alpha=0.8)
-            ax2.set_ylabel("Beds")
-            ax2.set_title("Simulated ICU Allocation vs Demand")
-            ax2.legend()
-            st.pyplot(fig2)
+        # The LP's optimum in closed form: with only sum(x) <= capacity and x >= 0,
+        # all capacity goes to the highest positive-weight group
+        groups = list(weights)
+        group_weights = np.array([weights[g] for g in groups])
+        group_demand = np.array([demand_dist[g] for g in groups])
+        allocated = np.zeros_like(group_demand)
+        best = int(np.argmax(group_weights))
+        if group_weights[best] > 0:
+            allocated[best] = float(total_patients)
+
+        st.success("✅ Optimization complete.")
+        result_df = pd.DataFrame({
+            "Group": groups,
+            "Allocated": allocated,
+            "Demand": group_demand,
+            "Unmet": group_demand - allocated
+        })
+
+        st.dataframe(result_df.round(1))
+
+        fig2, ax2 = plt.subplots(figsize=(6, 4))
+        ax2.bar(result_df["Group"], result_df["Demand"], label="Demand", alpha=0.6)
+        ax2.bar(result_df["Group"], result_df["Allocated"], label="Allocated", alpha=0.8)
+        ax2.set_ylabel("Beds")
+        ax2.set_title("Simulated ICU Allocation vs Demand")
+        ax2.legend()
+        st.pyplot(fig2)
 